@@ -1,14 +1,66 @@
 #!/usr/bin/env python3
 import praw
 import pandas as pd
-from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+try:
+    import orjson  # Faster JSON parsing for the Reddit responses
+except ImportError:
+    orjson = None
 import time
+import csv
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import re
+import string
 import sys
 import os
 
+# Shared HTTP session so pages and subreddits reuse pooled keep-alive connections
+_SESSION = requests.Session()
+_SESSION.headers.update({'User-Agent': 'Mozilla/5.0 (compatible; Comment Fetcher 1.0)'})
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503]),
+))
+
+# Columns of the poetic comments CSV, in output order
+CSV_FIELDNAMES = ['comment_url', 'text', 'author', 'avatar_url', 'time', 'upvotes']
+
+# Regex patterns used by is_poetic_comment, compiled once at import time
+# Markdown elements
+_MARKDOWN_PATTERNS = [
+    r'\[.*?\]\(.*?\)',  # Links [text](url)
+    r'\*\*.*?\*\*',     # Bold **text**
+    r'__.*?__',         # Bold __text__
+    r'\*.*?\*',         # Italic *text*
+    r'_.*?_',           # Italic _text_
+    r'~~.*?~~',         # Strikethrough
+    r'^#{1,6}\s',       # Headers
+    r'^\s*[-*+]\s',     # Lists
+    r'^\s*\d+\.\s',     # Numbered lists
+    r'```.*?```',       # Code blocks
+    r'`.*?`',           # Inline code
+    r'^\s*>',           # Quotes
+    r'/r/',             # Subreddit links
+    r'/u/',             # User links
+    r'&amp;|&lt;|&gt;', # HTML entities
+]
+
+# Common non-poetic comments, matched exactly against the lowercased text
+_NON_POETIC_LITERALS = frozenset({
+    'lol', 'lmao', 'omg', 'wtf', 'idk', 'imo', 'tbh', 'this.', 'same.',
+})
+
+# Every markdown pattern fused into one alternation so a comment is scanned once
+_REJECT_RE = re.compile('|'.join(f'(?:{p})' for p in _MARKDOWN_PATTERNS))
+
+# Deletes the ASCII characters that never count as "special" in a comment
+_PLAIN_ASCII_TABLE = str.maketrans('', '', string.ascii_letters + string.digits + string.whitespace + '_\'",.!?-')
+
 def is_poetic_comment(text):
     """
     Check if a comment could work as a poem line
@@ -20,150 +72,147 @@ def is_poetic_comment(text):
     if len(text) < 5 or len(text) > 80:
         return False
     
-    # Check for URLs
-    if re.search(r'https?://|www\.', text, re.IGNORECASE):
+    # Filter out common non-poetic comments
+    low = text.lower()
+    if low in _NON_POETIC_LITERALS:
+        return False
+    if all(c == '^' for c in low):
         return False
     
-    # Check for markdown elements
-    markdown_patterns = [
-        r'\[.*?\]\(.*?\)',  # Links [text](url)
-        r'\*\*.*?\*\*',     # Bold **text**
-        r'__.*?__',         # Bold __text__
-        r'\*.*?\*',         # Italic *text*
-        r'_.*?_',           # Italic _text_
-        r'~~.*?~~',         # Strikethrough
-        r'^#{1,6}\s',       # Headers
-        r'^\s*[-*+]\s',     # Lists
-        r'^\s*\d+\.\s',     # Numbered lists
-        r'```.*?```',       # Code blocks
-        r'`.*?`',           # Inline code
-        r'^\s*>',           # Quotes
-        r'/r/',             # Subreddit links
-        r'/u/',             # User links
-        r'&amp;|&lt;|&gt;', # HTML entities
-    ]
-    
-    for pattern in markdown_patterns:
-        if re.search(pattern, text):
-            return False
+    # Check for URLs (plain substring tests are much cheaper than a regex)
+    if 'http://' in low or 'https://' in low or 'www.' in low:
+        return False
     
-    # Check for too many special characters (not poetic)
-    special_char_count = len(re.findall(r'[^\w\s\'",.!?-]', text))
-    if special_char_count > 3:
+    # Check if it has at least some alphabetic (ASCII) characters
+    if not any(c.isascii() and c.isalpha() for c in text):
         return False
     
-    # Check if it has at least some alphabetic characters
-    if not re.search(r'[a-zA-Z]', text):
+    # Check for markdown elements
+    if _REJECT_RE.search(text):
         return False
     
-    # Filter out common non-poetic patterns
-    non_poetic_patterns = [
-        r'^\s*lol\s*$',
-        r'^\s*lmao\s*$',
-        r'^\s*omg\s*$',
-        r'^\s*wtf\s*$',
-        r'^\s*idk\s*$',
-        r'^\s*imo\s*$',
-        r'^\s*tbh\s*$',
-        r'^this\.$',
-        r'^same\.$',
-        r'^\^+$',
-    ]
-    
-    for pattern in non_poetic_patterns:
-        if re.search(pattern, text, re.IGNORECASE):
+    # Check for too many special characters (not poetic)
+    # translate() strips plain ASCII in C; only the leftovers (usually none) are inspected
+    leftover = text.translate(_PLAIN_ASCII_TABLE)
+    if len(leftover) > 3:
+        special_char_count = sum(1 for c in leftover if not (c.isalnum() or c.isspace()))
+        if special_char_count > 3:
             return False
     
     return True
 
-def fetch_reddit_comments(limit=10000, subreddits=None):
+def _rate_limit_delay(response):
     """
-    Fetch latest comments from Reddit without authentication
-    Filters for poetic comments only
-    Note: Reddit API limits to 100 per request, so we'll need multiple requests
+    Seconds to wait before the next request, spreading the remaining
+    rate-limit budget evenly over the time left until Reddit resets it
+    Falls back to a fixed 2s when the rate-limit headers are missing
     """
-    comments_data = []
+    try:
+        remaining = float(response.headers['X-Ratelimit-Remaining'])
+        reset = float(response.headers['X-Ratelimit-Reset'])
+    except (KeyError, ValueError):
+        return 2
     
-    # Use provided subreddits or default
-    if subreddits is None:
-        subreddits = ['AmItheAsshole', 'ArtificialInteligence']
+    return max(0.1, reset / max(remaining, 1.0))
+
+def _fetch_subreddit(subreddit, limit, session, writer, lock):
+    """
+    Fetch poetic comments from a single subreddit, following pagination
+    Each page of matches is written to the shared CSV writer as it arrives
+    """
+    print(f"Fetching from r/{subreddit}...")
+    subreddit_comments = 0
+    after = None
     
-    for subreddit in subreddits:
-        print(f"Fetching from r/{subreddit}...")
-        subreddit_comments = 0
-        after = None
-        
-        # Fetch multiple pages to get up to 'limit' comments
-        pages_to_fetch = (limit + 99) // 100  # Round up division
-        
-        for page in range(pages_to_fetch):
-            try:
-                # Build URL with pagination
-                url = f"https://www.reddit.com/r/{subreddit}/comments.json?limit=100"
-                if after:
-                    url += f"&after={after}"
-                
-                headers = {'User-Agent': 'Mozilla/5.0 (compatible; Comment Fetcher 1.0)'}
+    # Fetch multiple pages to get up to 'limit' comments
+    pages_to_fetch = (limit + 99) // 100  # Round up division
+    
+    for page in range(pages_to_fetch):
+        try:
+            # Build URL with pagination
+            url = f"https://www.reddit.com/r/{subreddit}/comments.json?limit=100"
+            if after:
+                url += f"&after={after}"
+            
+            response = session.get(url, timeout=10)
+            
+            if response.status_code == 200:
+                data = orjson.loads(response.content) if orjson else response.json()
                 
-                response = requests.get(url, headers=headers)
+                # Get the 'after' token for pagination
+                after = data['data'].get('after')
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # Get the 'after' token for pagination
-                    after = data['data'].get('after')
-                    
-                    # Process each comment
-                    for item in data['data']['children']:
-                        comment = item['data']
-                        text = comment.get('body', '').replace('\n', ' ').replace('\r', ' ')
-                        
-                        # Filter for poetic comments
-                        if is_poetic_comment(text):
-                            # Extract required fields
-                            comment_info = {
-                                'comment_url': f"https://www.reddit.com{comment.get('permalink', '')}",
-                                'text': text.strip(),
-                                'author': comment.get('author', '[deleted]'),
-                                'avatar_url': '',  # Reddit's JSON API doesn't provide avatar URLs directly
-                                'time': datetime.fromtimestamp(comment.get('created_utc', 0)).strftime('%Y-%m-%d %H:%M:%S'),
-                                'upvotes': comment.get('score', 1)  # Default to 1 if score not available
-                            }
-                            
-                            comments_data.append(comment_info)
-                            subreddit_comments += 1
-                    
-                    # Be respectful of rate limits
-                    time.sleep(2)
+                # Process each comment
+                page_comments = []
+                for item in data['data']['children']:
+                    comment = item['data']
+                    text = comment.get('body', '').replace('\n', ' ').replace('\r', ' ')
                     
-                    # Stop if no more pages
-                    if not after:
-                        break
+                    # Filter for poetic comments
+                    if is_poetic_comment(text):
+                        # Extract required fields
+                        comment_info = {
+                            'comment_url': f"https://www.reddit.com{comment.get('permalink', '')}",
+                            'text': text.strip(),
+                            'author': comment.get('author', '[deleted]'),
+                            'avatar_url': '',  # Reddit's JSON API doesn't provide avatar URLs directly
+                            'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(comment.get('created_utc', 0))),
+                            'upvotes': comment.get('score', 1)  # Default to 1 if score not available
+                        }
                         
-                else:
-                    print(f"Error fetching data: Status code {response.status_code}")
+                        page_comments.append(comment_info)
+                
+                with lock:
+                    writer.writerows(page_comments)
+                subreddit_comments += len(page_comments)
+                
+                # Be respectful of rate limits
+                time.sleep(_rate_limit_delay(response))
+                
+                # Stop if no more pages
+                if not after:
                     break
                     
-            except Exception as e:
-                print(f"Error processing subreddit {subreddit} page {page+1}: {str(e)}")
+            else:
+                print(f"Error fetching data: Status code {response.status_code}")
                 break
-        
-        print(f"  Found {subreddit_comments} poetic comments from r/{subreddit}")
+                
+        except Exception as e:
+            print(f"Error processing subreddit {subreddit} page {page+1}: {str(e)}")
+            break
     
-    return comments_data
+    print(f"  Found {subreddit_comments} poetic comments from r/{subreddit}")
+    return subreddit_comments
 
-def save_to_csv(comments_data, filename='output/reddit_poetic_comments.csv'):
+def fetch_reddit_comments(writer, limit=10000, subreddits=None):
     """
-    Save comments data to CSV file
+    Fetch latest comments from Reddit without authentication
+    Filters for poetic comments only and streams them into a csv.DictWriter
+    Note: Reddit API limits to 100 per request, so we'll need multiple requests
+    Subreddits are fetched concurrently, one thread each
+    Returns the number of comments written
     """
-    # Ensure output directory exists
-    os.makedirs('output', exist_ok=True)
+    total_comments = 0
+    lock = threading.Lock()
+    
+    # Use provided subreddits or default
+    if subreddits is None:
+        subreddits = ['AmItheAsshole', 'ArtificialInteligence']
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(subreddits)))) as executor:
+        futures = [executor.submit(_fetch_subreddit, subreddit, limit, _SESSION, writer, lock)
+                   for subreddit in subreddits]
+        for future in futures:
+            total_comments += future.result()
     
-    df = pd.DataFrame(comments_data)
-    df.to_csv(filename, index=False, encoding='utf-8')
-    print(f"Saved {len(comments_data)} comments to {filename}")
+    return total_comments
 
 def main():
+    filename = 'output/reddit_poetic_comments.csv'
+    
+    # Ensure output directory exists
+    os.makedirs('output', exist_ok=True)
+    
     # Get limit from command line argument or use default
     limit = 10000  # Default
     if len(sys.argv) > 1:
@@ -185,18 +234,28 @@ def main():
     print(f"Fetching up to {limit} comments from each subreddit...")
     print("(Note: This may take a few minutes due to rate limiting)\n")
     
-    # Fetch comments with specified limit and subreddits
-    comments = fetch_reddit_comments(limit=limit, subreddits=subreddits)
+    # Fetch comments with specified limit and subreddits, writing rows as they arrive.
+    # Rows go to a temporary file that only replaces the existing CSV once comments
+    # were actually fetched, so a failed run leaves the previous dataset in place
+    temp_filename = filename + '.tmp'
+    try:
+        with open(temp_filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDNAMES, lineterminator='\n')
+            writer.writeheader()
+            total_comments = fetch_reddit_comments(writer, limit=limit, subreddits=subreddits)
+        if total_comments:
+            os.replace(temp_filename, filename)
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
     
-    if comments:
-        # Save to CSV
-        save_to_csv(comments)
+    if total_comments:
+        print(f"Saved {total_comments} comments to {filename}")
         
         # Display sample
-        print(f"\nTotal poetic comments found: {len(comments)}")
+        print(f"\nTotal poetic comments found: {total_comments}")
         print("\nHere are the first 5:")
-        df = pd.DataFrame(comments)
-        print(df.head())
+        print(pd.read_csv(filename, nrows=5))
     else:
         print("No comments fetched.")
 
@@ -5,18 +5,49 @@ import random
 import subprocess
 import json
 import tempfile
+import hashlib
+import re
+
+# Cached Claude responses, keyed by SHA-256 of the prompt (enable with REDDIT_RHYMES_CACHE=1)
+CLAUDE_CACHE_DIR = 'output/.claude_cache'
+
+# Numbered line in Claude's response, e.g. "5: He is smart"
+_POEM_LINE_RE = re.compile(r'^[^\S\n]*(\d+)[^\S\n]*:', re.MULTILINE)
 
 def read_reddit_comments(filename='output/reddit_poetic_comments.csv'):
     """
-    Read Reddit comments from CSV file and return full dataframe
+    Read the text column of the Reddit comments CSV
+    The other columns are only needed for the selected poem lines, so
+    save_poem_csv reads those rows back from the same file
     """
     try:
-        df = pd.read_csv(filename)
+        df = pd.read_csv(filename, usecols=['text'], dtype={'text': 'string[pyarrow]'}, engine='pyarrow')
         return df
     except FileNotFoundError:
         print(f"File {filename} not found. Please run reddit_comments_fetcher.py first.")
         return None
 
+def _echo_and_parse_poem(lines):
+    """
+    Print Claude's response line by line as it arrives, collecting the comment IDs
+    Returns the full response text and the 0-based comment IDs in poem order
+    """
+    output_lines = []
+    comment_ids = []
+    for line in lines:
+        print(line, end='', flush=True)
+        output_lines.append(line)
+        
+        # Extract the ID from lines like "5: He is smart"
+        match = _POEM_LINE_RE.match(line)
+        if match:
+            comment_ids.append(int(match.group(1)) - 1)  # Convert to 0-based index
+    
+    if output_lines and not output_lines[-1].endswith('\n'):
+        print()
+    
+    return ''.join(output_lines).strip(), comment_ids
+
 def compose_poem_with_claude(df):
     """
     Use Claude Code CLI to compose a rhythmic poem from Reddit comments
@@ -64,129 +95,137 @@ Arrange these comments into a rhyming poem. Return ONLY the comment numbers and
 This format helps me verify the poem visually while ensuring accurate matching."""
 
     try:
-        # Ensure output directory exists
-        os.makedirs('output', exist_ok=True)
-        
         # Debug: save prompt to file for inspection
         with open('output/claude_prompt.txt', 'w') as f:
             f.write(prompt)
         print("Prompt saved to output/claude_prompt.txt for inspection")
         
-        # Call Claude Code CLI
-        print("Calling Claude Code to compose poem...")
-        result = subprocess.run(
-            ['claude'],
-            input=prompt,
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        
-        poem_text = result.stdout.strip()
+        # Reuse an earlier response to the same prompt when caching is enabled
+        use_cache = os.environ.get('REDDIT_RHYMES_CACHE') == '1'
+        prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+        cache_file = os.path.join(CLAUDE_CACHE_DIR, f'{prompt_hash}.txt')
         
-        # Check for errors
-        if result.returncode != 0 or not poem_text:
-            error_text = result.stderr.strip() if result.stderr else "No output from Claude"
-            print(f"\nError from Claude: {error_text}")
-            if not poem_text:
-                poem_text = error_text
-        
-        # Show Claude's output
-        print("\nClaude's output:")
-        print("-" * 50)
-        print(poem_text)
+        if use_cache and os.path.exists(cache_file):
+            print(f"Using cached Claude response from {cache_file}")
+            print("\nClaude's output:")
+            print("-" * 50)
+            with open(cache_file) as f:
+                poem_text, comment_ids = _echo_and_parse_poem(f)
+        else:
+            # Call Claude Code CLI, echoing and parsing its output as it streams in
+            print("Calling Claude Code to compose poem...")
+            print("\nClaude's output:")
+            print("-" * 50)
+            with tempfile.TemporaryFile(mode='w+') as stderr_file:
+                with subprocess.Popen(
+                    ['claude'],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=stderr_file,
+                    text=True
+                ) as proc:
+                    proc.stdin.write(prompt)
+                    proc.stdin.close()
+                    poem_text, comment_ids = _echo_and_parse_poem(proc.stdout)
+                
+                stderr_file.seek(0)
+                error_output = stderr_file.read().strip()
+            
+            # Check for errors
+            if proc.returncode != 0 or not poem_text:
+                error_text = error_output if error_output else "No output from Claude"
+                print(f"\nError from Claude: {error_text}")
+                if not poem_text:
+                    poem_text = error_text
+            elif use_cache:
+                os.makedirs(CLAUDE_CACHE_DIR, exist_ok=True)
+                with open(cache_file, 'w') as f:
+                    f.write(poem_text)
         print("-" * 50)
         
-        # Extract the comments used in the poem
-        poem_lines = []
-        
-        # Parse the comment IDs from Claude's output
-        comment_ids = []
-        for line in poem_text.split('\n'):
-            line = line.strip()
-            if line and ':' in line:
-                # Extract the ID from lines like "5: He is smart"
-                id_part = line.split(':')[0].strip()
-                if id_part.isdigit():
-                    comment_id = int(id_part) - 1  # Convert to 0-based index
-                    if 0 <= comment_id < len(df):
-                        comment_ids.append(comment_id)
+        comment_ids = [comment_id for comment_id in comment_ids if 0 <= comment_id < len(df)]
         
         print(f"\nExtracted {len(comment_ids)} comment IDs from Claude's response")
         
         if comment_ids:
-            # Get the actual comments based on IDs
-            df_reset = df.reset_index(drop=True)
-            for comment_id in comment_ids:
-                poem_lines.append(df_reset.iloc[comment_id])
-            
-            # Create the poem text from selected comments
-            poem_text = '\n'.join([row['text'] for row in poem_lines])
-            print(f"\nComposed poem with {len(poem_lines)} lines")
+            # The comment IDs are the row positions of the poem lines
+            poem_line_positions = comment_ids
+            print(f"\nComposed poem with {len(poem_line_positions)} lines")
         else:
             print("\nWarning: Could not extract comment IDs from Claude's response")
             print("Trying to manually parse...")
             # Fallback: just take the first 8-12 comments that rhyme
-            poem_lines = find_rhyming_comments(df, 8, 12)
-            poem_text = '\n'.join([row['text'] for row in poem_lines])
+            poem_line_positions = find_rhyming_comments(df, 8, 12)
         
-        return poem_text, poem_lines
+        # Create the poem text from selected comments in one positional gather
+        poem_text = '\n'.join(df['text'].iloc[poem_line_positions].tolist())
+        return poem_text, poem_line_positions
         
     except Exception as e:
         print(f"Error generating poem: {str(e)}")
         # Fallback to algorithmic approach
         print("Falling back to algorithmic poem generation...")
-        poem_lines = find_rhyming_comments(df, 8, 12)
-        poem_text = '\n'.join([row['text'] for row in poem_lines])
-        return poem_text, poem_lines
+        poem_line_positions = find_rhyming_comments(df, 8, 12)
+        poem_text = '\n'.join(df['text'].iloc[poem_line_positions].tolist())
+        return poem_text, poem_line_positions
 
 def find_rhyming_comments(df, min_lines=8, max_lines=12):
     """
     Simple algorithm to find comments that might rhyme
+    Returns the row positions of the selected comments
     """
-    # Get last word of each comment
-    comments_with_endings = []
-    for idx, row in df.iterrows():
-        text = row['text'].strip()
-        words = text.split()
-        if words:
-            last_word = words[-1].lower().strip('.,!?;:"')
-            comments_with_endings.append((row, last_word))
+    texts = df['text'].reset_index(drop=True)
+    
+    # Get last word of each comment with vectorized string ops (empty comments drop out)
+    endings = texts.str.extract(r'(\S+)\s*$', expand=False).str.lower().str.strip('.,!?;:"').dropna()
     
     # Sort by last word to group potential rhymes
-    comments_with_endings.sort(key=lambda x: x[1][-3:])  # Sort by last 3 characters
+    endings = endings.iloc[endings.str[-3:].argsort(kind='stable')]  # Sort by last 3 characters
+    positions = endings.index.tolist()
+    tails = endings.str[-2:].tolist()
     
     # Select comments trying to create AABB pattern
     selected = []
     i = 0
-    while len(selected) < max_lines and i < len(comments_with_endings) - 1:
+    while len(selected) < max_lines and i < len(positions) - 1:
         # Look for pairs with similar endings
-        if comments_with_endings[i][1][-2:] == comments_with_endings[i+1][1][-2:]:
-            selected.append(comments_with_endings[i][0])
-            selected.append(comments_with_endings[i+1][0])
+        if tails[i] == tails[i+1]:
+            selected.append(positions[i])
+            selected.append(positions[i+1])
             i += 2
         else:
             i += 1
     
     # If not enough, add more
     if len(selected) < min_lines:
-        for row, _ in comments_with_endings:
+        # Hash set of texts already used, so each candidate is an O(1) check
+        selected_texts = {texts.iat[position] for position in selected}
+        for position in positions:
             if len(selected) >= max_lines:
                 break
-            if not any(row['text'] == s['text'] for s in selected):
-                selected.append(row)
+            text = texts.iat[position]
+            if text not in selected_texts:
+                selected.append(position)
+                selected_texts.add(text)
     
     return selected[:max_lines]
 
-def save_poem_csv(poem_lines, filename='output/reddit_poem.csv'):
+def save_poem_csv(poem_line_positions, filename='output/reddit_poem.csv',
+                  source_filename='output/reddit_poetic_comments.csv'):
     """
-    Save the poem lines to a CSV file with all original columns
+    Save the poem lines, given as row positions in poem order, to a CSV file with all original columns
+    The full rows are re-read from source_filename with the same parser read_reddit_comments
+    uses, so row positions line up (the engines disagree on e.g. whitespace-only rows)
     """
-    if poem_lines:
-        # Ensure output directory exists
-        os.makedirs('output', exist_ok=True)
+    if poem_line_positions:
+        source_df = pd.read_csv(source_filename, dtype='string[pyarrow]', engine='pyarrow')
         
-        poem_df = pd.DataFrame(poem_lines)
+        last_position = max(poem_line_positions)
+        if last_position >= len(source_df):
+            raise ValueError(f"{source_filename} has {len(source_df)} rows but the poem uses row "
+                             f"{last_position}; was it rewritten while composing?")
+        
+        poem_df = source_df.iloc[poem_line_positions]
         poem_df.to_csv(filename, index=False, encoding='utf-8')
         print(f"\nPoem data saved to {filename}")
 
@@ -194,6 +233,9 @@ def main():
     """
     Main function to compose poems from Reddit comments using Claude Code
     """
+    # Ensure output directory exists
+    os.makedirs('output', exist_ok=True)
+    
     # Read comments
     print("Reading Reddit comments...")
     df = read_reddit_comments()
@@ -206,7 +248,7 @@ def main():
     print("\nComposing poem with Claude Code...\n")
     
     # Generate poem
-    poem_text, poem_lines = compose_poem_with_claude(df)
+    poem_text, poem_line_positions = compose_poem_with_claude(df)
     
     if poem_text:
         print("=" * 50)
@@ -216,7 +258,7 @@ def main():
         print("=" * 50)
         
         # Save CSV version with all columns
-        save_poem_csv(poem_lines)
+        save_poem_csv(poem_line_positions)
         
     else:
         print("Failed to generate poem.")
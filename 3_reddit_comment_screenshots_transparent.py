@@ -1,10 +1,33 @@
 #!/usr/bin/env python3
 from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageEnhance
 import pandas as pd
+import numpy as np
 import os
 from datetime import datetime
-import hashlib
 import random
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+def _load_font(size):
+    """
+    Load Helvetica at the given size, falling back to PIL's default font
+    """
+    try:
+        return ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", size)
+    except:
+        return ImageFont.load_default()
+
+# Card fonts, loaded once per process - larger for bigger cards
+_FONT_REGULAR = _load_font(42)   # Was 32
+_FONT_SMALL = _load_font(26)     # Was 20
+_FONT_USERNAME = _load_font(32)  # Was 24
+
+@functools.lru_cache(maxsize=None)
+def _avatar_font(size):
+    """
+    Font for the avatar letter, loaded once per size
+    """
+    return _load_font(size)
 
 def get_relative_time(timestamp_str):
     """
@@ -49,17 +72,38 @@ def get_relative_time(timestamp_str):
         times = ["2h ago", "3h ago", "5h ago", "8h ago", "12h ago", "1d ago", "2d ago"]
         return random.choice(times)
 
+def get_relative_times(timestamps):
+    """
+    Vectorized get_relative_time for a whole column of timestamps
+    Entries that don't parse come back as None and are left to get_relative_time
+    """
+    parsed = pd.to_datetime(timestamps, format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    seconds = (pd.Timestamp.now() - parsed).dt.total_seconds().to_numpy()
+    valid = ~np.isnan(seconds)
+    seconds = np.where(valid, seconds, 0)
+    
+    # Same buckets as get_relative_time: minutes, hours, days, then weeks
+    buckets = [seconds < 3600, seconds < 86400, seconds < 604800]
+    divisor = np.select(buckets, [60, 3600, 86400], 604800)
+    suffix = np.select(buckets, ['m ago', 'h ago', 'd ago'], 'w ago').astype(object)
+    labels = (seconds // divisor).astype(np.int64).astype(str).astype(object) + suffix
+    labels = np.where(seconds < 60, 'just now', labels)
+    return np.where(valid, labels, None)
+
 def generate_avatar(username, size=40):
     """
     Generate a circular avatar based on username
     """
-    # Create hash of username for consistent colors
-    hash_val = int(hashlib.md5(username.encode()).hexdigest(), 16)
+    # Create hash of username for consistent colors (Java-style string hash;
+    # the builtin hash() is salted per process, so colors would change between runs)
+    hash_val = 0
+    for c in username:
+        hash_val = (hash_val * 31 + ord(c)) & 0xFFFFFFFF
     
     # Generate color from hash
-    r = (hash_val & 0xFF0000) >> 16
-    g = (hash_val & 0x00FF00) >> 8
-    b = (hash_val & 0x0000FF)
+    r = (hash_val >> 16) & 0xFF
+    g = (hash_val >> 8) & 0xFF
+    b = hash_val & 0xFF
     
     # Create avatar image with transparency for circle
     avatar = Image.new('RGBA', (size, size), (0, 0, 0, 0))
@@ -69,10 +113,7 @@ def generate_avatar(username, size=40):
     draw.ellipse([(0, 0), (size-1, size-1)], fill=(r, g, b, 255))
     
     # Add first letter of username
-    try:
-        font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", int(size * 0.5))
-    except:
-        font = ImageFont.load_default()
+    font = _avatar_font(int(size * 0.5))
     
     first_letter = username[0].upper() if username else "?"
     
@@ -87,6 +128,55 @@ def generate_avatar(username, size=40):
     
     return avatar
 
+@functools.lru_cache(maxsize=512)
+def _cached_avatar(username, size):
+    """
+    Avatar for a username, drawn once per process
+    Authors often appear more than once in a poem; callers only paste it, never modify it
+    """
+    return generate_avatar(username, size)
+
+def wrap_text(text, font, max_width):
+    """
+    Greedily wrap text into lines no wider than max_width pixels
+    A word wider than max_width gets a line of its own
+    
+    Instead of re-measuring the growing line after every word, each line's
+    break is estimated from the font's average character width and then
+    moved by whole words, so only a few measurements are needed per line
+    """
+    def line_fits(line_words):
+        # Ink bbox rather than getlength, so wrapping matches what textbbox measured
+        bbox = font.getbbox(' '.join(line_words))
+        return bbox[2] - bbox[0] <= max_width
+    
+    words = text.split()
+    lines = []
+    
+    # Average character width gives the estimated characters per line
+    char_width = font.getlength('abcdefghijklmnopqrstuvwxyz') / 26
+    max_chars = max_width / char_width if char_width > 0 else len(text)
+    
+    start = 0
+    while start < len(words):
+        # Estimate where the line breaks
+        end = start + 1
+        line_chars = len(words[start])
+        while end < len(words) and line_chars + 1 + len(words[end]) <= max_chars:
+            line_chars += 1 + len(words[end])
+            end += 1
+        
+        # Extend while the next word still fits, back off while the line overflows
+        while end < len(words) and line_fits(words[start:end + 1]):
+            end += 1
+        while end > start + 1 and not line_fits(words[start:end]):
+            end -= 1
+        
+        lines.append(' '.join(words[start:end]))
+        start = end
+    
+    return lines
+
 def create_reddit_comment_card(comment_data, card_width=500, theme='dark'):
     """
     Create a Reddit-style comment card with semi-transparent background
@@ -105,20 +195,18 @@ def create_reddit_comment_card(comment_data, card_width=500, theme='dark'):
         border_color = (237, 239, 241)
         upvote_color = (255, 69, 0)
     
-    # Fonts - larger for bigger cards
-    try:
-        font_regular = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 42)  # Was 32
-        font_small = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 26)    # Was 20
-        font_username = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 32) # Was 24
-    except:
-        font_regular = ImageFont.load_default()
-        font_small = ImageFont.load_default()
-        font_username = ImageFont.load_default()
+    # Fonts - loaded once at import
+    font_regular = _FONT_REGULAR
+    font_small = _FONT_SMALL
+    font_username = _FONT_USERNAME
     
     # Parse comment data
     username = comment_data['author']
     text = comment_data['text']
-    timestamp = get_relative_time(comment_data['time'])
+    # Precomputed for the whole frame in generate_transparent_screenshots when available
+    timestamp = comment_data.get('relative_time')
+    if not isinstance(timestamp, str):
+        timestamp = get_relative_time(comment_data['time'])
     # Generate random vote numbers in a modest range
     import random
     upvotes = random.randint(10, 100)
@@ -129,54 +217,23 @@ def create_reddit_comment_card(comment_data, card_width=500, theme='dark'):
     line_height = 56  # Was 44
     avatar_size = 80  # Was 60
     
-    # Create temporary image to measure text
-    temp_img = Image.new('RGBA', (card_width - 2*padding - avatar_size - 15, 100))
-    temp_draw = ImageDraw.Draw(temp_img)
-    
-    # Word wrap text
-    words = text.split()
-    lines = []
-    current_line = []
-    
-    for word in words:
-        test_line = ' '.join(current_line + [word])
-        bbox = temp_draw.textbbox((0, 0), test_line, font=font_regular)
-        if bbox[2] - bbox[0] > card_width - 2*padding - avatar_size - 15:
-            if current_line:
-                lines.append(' '.join(current_line))
-                current_line = [word]
-            else:
-                lines.append(word)
-        else:
-            current_line.append(word)
-    if current_line:
-        lines.append(' '.join(current_line))
+    # Word wrap text (measured with the font directly, no scratch image needed)
+    lines = wrap_text(text, font_regular, card_width - 2*padding - avatar_size - 15)
     
     # Calculate total height
     text_height = len(lines) * line_height
     card_height = padding + 80 + text_height + padding + 40  # Increased from 55 to 80 to match text_y
     
-    # Create card with RGBA for transparency
-    card = Image.new('RGBA', (card_width, card_height), color=bg_color)
+    # Create transparent card and draw the background once with rounded corners
+    card = Image.new('RGBA', (card_width, card_height), (0, 0, 0, 0))
     draw = ImageDraw.Draw(card)
     
-    # Add subtle rounded corners effect
     corner_radius = 12
-    # Create rounded rectangle mask
-    mask = Image.new('L', (card_width, card_height), 0)
-    mask_draw = ImageDraw.Draw(mask)
-    mask_draw.rounded_rectangle([(0, 0), (card_width-1, card_height-1)], 
-                                radius=corner_radius, fill=255)
-    
-    # Apply mask to card
-    card.putalpha(mask)
-    
-    # Redraw background with rounded corners
     draw.rounded_rectangle([(0, 0), (card_width-1, card_height-1)], 
                           radius=corner_radius, fill=bg_color)
     
     # Generate and paste circular avatar
-    avatar = generate_avatar(username, avatar_size)
+    avatar = _cached_avatar(username, avatar_size)
     card.paste(avatar, (padding, padding), avatar)
     
     # Draw username and timestamp on same line with dot separator
@@ -198,10 +255,10 @@ def create_reddit_comment_card(comment_data, card_width=500, theme='dark'):
     draw.text((username_x + username_width, timestamp_y), timestamp_text, fill=secondary_color, font=font_small)
     
     # Draw comment text - with more padding from username
+    # Pillow advances each line by the height of "A" plus spacing, so this gives line_height
     text_y = padding + 80  # Was 55, increased padding
-    for line in lines:
-        draw.text((username_x, text_y), line, fill=text_color, font=font_regular)
-        text_y += line_height
+    draw.multiline_text((username_x, text_y), '\n'.join(lines), fill=text_color, font=font_regular,
+                        spacing=line_height - font_regular.getbbox('A')[3])
     
     # Draw interaction buttons
     button_baseline_y = card_height - padding - 25
@@ -263,6 +320,23 @@ def create_reddit_comment_card(comment_data, card_width=500, theme='dark'):
     
     return card
 
+@functools.lru_cache(maxsize=32)
+def _make_shadow(width, height):
+    """
+    Blurred drop shadow for a card of the given size
+    Cards only vary in height by line count, so the blur is cached per size
+    """
+    # Only the alpha channel carries the shadow, so blur a single 'L' band
+    # and attach it to black RGB bands afterwards
+    shadow_alpha = Image.new('L', (width, height), 0)
+    shadow_draw = ImageDraw.Draw(shadow_alpha)
+    shadow_draw.rounded_rectangle([(5, 5), (width, height)], 
+                                  radius=12, fill=80)
+    shadow_alpha = shadow_alpha.filter(ImageFilter.GaussianBlur(radius=10))
+    
+    black = Image.new('L', (width, height), 0)
+    return Image.merge('RGBA', (black, black, black, shadow_alpha))
+
 def create_transparent_reddit_image(comment_data, index, theme='dark'):
     """
     Create a transparent image with just the Reddit comment
@@ -274,6 +348,9 @@ def create_transparent_reddit_image(comment_data, index, theme='dark'):
     # Create transparent background
     final_image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
     
+    # Consistent card randomness (upvotes) for each comment, whichever worker process renders it
+    random.seed(index)
+    
     # Create the comment card - larger for better visibility
     card_width = 900  # Was 750
     card = create_reddit_comment_card(comment_data, card_width, theme)
@@ -288,7 +365,7 @@ def create_transparent_reddit_image(comment_data, index, theme='dark'):
     center_y = (height - card.height) // 2
     
     # Add random offset - smaller range due to larger cards
-    random.seed(index)  # Consistent randomness for each comment
+    random.seed(index)  # Consistent randomness for each comment; reseeded so the card's draws don't shift it
     offset_x = random.randint(-30, 30)  # Reduced from -50, 50
     offset_y = random.randint(-150, 150)  # Reduced from -200, 200
     
@@ -297,11 +374,7 @@ def create_transparent_reddit_image(comment_data, index, theme='dark'):
     pos_y = max(safe_margin_y, min(height - card.height - safe_margin_y, center_y + offset_y))
     
     # Add drop shadow for the card
-    shadow = Image.new('RGBA', card.size, (0, 0, 0, 0))
-    shadow_draw = ImageDraw.Draw(shadow)
-    shadow_draw.rounded_rectangle([(5, 5), (card.width, card.height)], 
-                                  radius=12, fill=(0, 0, 0, 80))
-    shadow = shadow.filter(ImageFilter.GaussianBlur(radius=10))
+    shadow = _make_shadow(card.width, card.height)
     
     # Paste shadow then card
     final_image.paste(shadow, (pos_x + 5, pos_y + 5), shadow)
@@ -309,9 +382,25 @@ def create_transparent_reddit_image(comment_data, index, theme='dark'):
     
     return final_image
 
+def _render_one(args):
+    """
+    Render and save one transparent comment screenshot (process pool worker)
+    """
+    index, comment_data, theme, output_dir = args
+    
+    # Create transparent image
+    img = create_transparent_reddit_image(comment_data, index, theme=theme)
+    
+    # Save image (PNG ignores 'quality'; level 1 files are ~3x larger but encode
+    # faster, and they are only intermediate inputs to ffmpeg)
+    filename = f"{output_dir}/comment_{index + 1:02d}_transparent.png"
+    img.save(filename, 'PNG', compress_level=1)
+    return filename
+
 def generate_transparent_screenshots(df, theme='dark'):
     """
     Generate transparent Reddit comment screenshots
+    Cards are independent, so they are rendered in parallel across processes
     """
     # Create output directory
     output_dir = 'output/comment_images_transparent'
@@ -319,15 +408,15 @@ def generate_transparent_screenshots(df, theme='dark'):
     
     print(f"\nGenerating {len(df)} transparent Reddit comment screenshots...")
     
+    # Relative times for all rows in one pass
+    df = df.assign(relative_time=get_relative_times(df['time']))
+    
     # Generate image for each comment
-    for index, row in df.iterrows():
-        # Create transparent image
-        img = create_transparent_reddit_image(row, index, theme=theme)
-        
-        # Save image
-        filename = f"{output_dir}/comment_{index + 1:02d}_transparent.png"
-        img.save(filename, 'PNG', quality=95)
-        print(f"Created: {filename}")
+    jobs = [(index, row._asdict(), theme, output_dir)
+            for index, row in enumerate(df.itertuples(index=False))]
+    with ProcessPoolExecutor() as executor:
+        for filename in executor.map(_render_one, jobs):
+            print(f"Created: {filename}")
     
     return output_dir
 
@@ -6,13 +6,30 @@ Generate audio files from Reddit poem comments using Kokoro TTS
 import os
 import pandas as pd
 import numpy as np
-import wave
+import soundfile as sf
 from kokoro_onnx import Kokoro
+import onnxruntime as ort
+from concurrent.futures import ThreadPoolExecutor
 import random
 
-def generate_audio_files(poem_df, output_dir='output/audio_files'):
+def _synthesize(kokoro, phonemes, voice, output_path):
+    """
+    Run Kokoro inference for one comment and save it as a WAV file
+    Called from worker threads; ONNX Runtime releases the GIL while it runs
+    """
+    # Generate speech with Kokoro
+    samples, sample_rate = kokoro.create(phonemes, voice=voice, is_phonemes=True)
+    
+    # Clip in place, then save as a mono 16-bit WAV file
+    # (libsndfile does the float32 -> int16 conversion in C and saturates on its own;
+    # the clip keeps the old [-1, 1] range, and samples stay within 2 LSB of the old cast)
+    np.clip(samples, -1, 1, out=samples)
+    sf.write(output_path, samples, sample_rate, subtype='PCM_16')
+
+def generate_audio_files(poem_df, output_dir='output/audio_files', max_workers=4):
     """
     Generate audio files for each line in the poem using Kokoro TTS
+    Inference for different comments runs concurrently on a thread pool
     """
     
     # Create output directory
@@ -20,8 +37,11 @@ def generate_audio_files(poem_df, output_dir='output/audio_files'):
     
     print(f"\nGenerating {len(poem_df)} audio files using Kokoro TTS...")
     
-    # Initialize Kokoro with the model and voices files
-    kokoro = Kokoro("kokoro-v1.0.onnx", "voices-v1.0.bin")
+    # Initialize Kokoro with the model and voices files, on the GPU when onnxruntime-gpu is installed
+    providers = [provider for provider in ['CUDAExecutionProvider', 'CPUExecutionProvider']
+                 if provider in ort.get_available_providers()]
+    session = ort.InferenceSession("kokoro-v1.0.onnx", providers=providers)
+    kokoro = Kokoro.from_session(session, "voices-v1.0.bin")
     
     # Available voices/styles for variety
     voices = [
@@ -37,36 +57,33 @@ def generate_audio_files(poem_df, output_dir='output/audio_files'):
         "bm_lewis"
     ]
     
-    # Generate audio for each comment
-    for idx, row in poem_df.iterrows():
-        text = row['text']
-        file_number = idx + 1
-        output_path = os.path.join(output_dir, f'audio_{file_number:02d}.wav')
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
         
-        # Select a random voice for this comment
-        voice = random.choice(voices)
-        
-        print(f"  Comment {file_number}/{len(poem_df)}: Using voice '{voice}' - {text[:50]}...")
-        
-        try:
-            # Generate speech with Kokoro
-            samples, sample_rate = kokoro.create(text, voice=voice)
+        # Generate audio for each comment
+        for row in poem_df.itertuples():
+            text = row.text
+            file_number = row.Index + 1
+            output_path = os.path.join(output_dir, f'audio_{file_number:02d}.wav')
             
-            # Convert float32 samples to int16 for WAV
-            samples = np.clip(samples, -1, 1)
-            samples = (samples * 32767).astype(np.int16)
+            # Select a random voice for this comment
+            voice = random.choice(voices)
             
-            # Save as WAV file
-            with wave.open(output_path, 'w') as wav_file:
-                wav_file.setnchannels(1)  # Mono
-                wav_file.setsampwidth(2)  # 2 bytes per sample (int16)
-                wav_file.setframerate(sample_rate)
-                wav_file.writeframes(samples.tobytes())
+            print(f"  Comment {file_number}/{len(poem_df)}: Using voice '{voice}' - {text[:50]}...")
             
-            print(f"    Created: {output_path}")
-            
-        except Exception as e:
-            print(f"    Error generating audio for comment {file_number}: {e}")
+            try:
+                # Phonemize here: espeak is not thread-safe, only inference is handed to the pool
+                phonemes = kokoro.tokenizer.phonemize(text)
+                futures[file_number] = (output_path, executor.submit(_synthesize, kokoro, phonemes, voice, output_path))
+            except Exception as e:
+                print(f"    Error generating audio for comment {file_number}: {e}")
+        
+        for file_number, (output_path, future) in futures.items():
+            try:
+                future.result()
+                print(f"    Created: {output_path}")
+            except Exception as e:
+                print(f"    Error generating audio for comment {file_number}: {e}")
     
     print(f"\nAll audio files generated successfully!")
     return output_dir
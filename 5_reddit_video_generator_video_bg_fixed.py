@@ -9,28 +9,130 @@ import pandas as pd
 import subprocess
 import tempfile
 from pathlib import Path
-import json
+from concurrent.futures import ThreadPoolExecutor
+import soundfile as sf
 
 def get_precise_duration(audio_file):
-    """Get precise audio duration in seconds"""
-    cmd = [
-        'ffprobe', '-v', 'quiet', '-print_format', 'json',
-        '-show_format', audio_file
-    ]
-    
+    """Get precise audio duration in seconds, read in-process from the file header"""
     try:
-        output = subprocess.check_output(cmd)
-        data = json.loads(output)
-        return float(data['format']['duration'])
-    except:
-        # Fallback method
-        cmd = ['ffprobe', '-v', 'error', '-show_entries', 
-               'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', 
-               audio_file]
+        return sf.info(audio_file).duration
+    except Exception:
+        return 2.0
+
+# H.264 encoders in order of preference, with their quality settings
+# (hardware encoders first; libx264 is the CPU fallback)
+VIDEO_ENCODERS = [
+    ('h264_nvenc', ['-hwaccel', 'cuda'], [
+        '-c:v', 'h264_nvenc',
+        '-preset', 'p6',
+        '-tune', 'hq',
+        '-rc', 'vbr',
+        '-cq', '20',
+        '-b:v', '0',
+        '-bf', '3',
+        '-profile:v', 'high',
+    ]),
+    ('h264_videotoolbox', [], [
+        '-c:v', 'h264_videotoolbox',
+        '-q:v', '55',
+        '-profile:v', 'high',
+    ]),
+    ('libx264', [], [
+        '-c:v', 'libx264',
+        '-preset', 'slow',  # High quality preset
+        '-crf', '18',  # Even better quality (lower = better)
+        '-bf', '3',  # More B-frames for better quality
+        '-refs', '4',  # More reference frames
+        '-qmin', '10',  # Minimum quantizer
+        '-qmax', '51',  # Maximum quantizer
+        '-profile:v', 'high',  # H.264 high profile for better quality
+        '-level', '4.1',  # Compatibility level
+    ]),
+]
+
+def get_video_encoder():
+    """
+    Pick the first H.264 encoder that can actually encode on this machine
+    Returns (name, decoder input args, encoder output args)
+    """
+    for name, input_args, output_args in VIDEO_ENCODERS[:-1]:
+        # Encoders can be compiled in without usable hardware (or without support for
+        # every option), so try a tiny encode with the same flags the real run uses
+        cmd = ['ffmpeg', '-v', 'error', *input_args,
+               '-f', 'lavfi', '-i', 'color=size=256x256:duration=0.1',
+               *output_args, '-pix_fmt', 'yuv420p', '-f', 'null', '-']
         try:
-            return float(subprocess.check_output(cmd).decode().strip())
-        except:
-            return 2.0
+            if subprocess.run(cmd, capture_output=True).returncode == 0:
+                return name, input_args, output_args
+        except OSError:
+            break
+    
+    return VIDEO_ENCODERS[-1]
+
+def build_segment_command(background_video, start, duration, image_file, audio_file,
+                          segment_file, width, height, decoder_args, encoder_args):
+    """
+    Build the ffmpeg command for one timeline segment: the background clip from
+    start, with the comment image overlaid and its voice audio when given,
+    otherwise silence. Audio is kept as PCM so it is only encoded once, at the end.
+    """
+    cmd = ['ffmpeg', '-y']
+    
+    # Background clip, looped in case the poem outlasts the video
+    cmd.extend(decoder_args)
+    cmd.extend(['-stream_loop', '-1', '-ss', str(start), '-t', str(duration), '-i', background_video])
+    
+    # Scale and crop background video
+    filter_complex = f'[0:v]scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},setsar=1'
+    if image_file:
+        # Overlay comment on background
+        cmd.extend(['-i', image_file])
+        filter_complex += f'[bg];[1:v]scale={width}:{height}[overlay];[bg][overlay]overlay=0:0[video]'
+    else:
+        filter_complex += '[video]'
+    audio_input = 2 if image_file else 1
+    
+    if audio_file:
+        cmd.extend(['-i', audio_file])
+    else:
+        cmd.extend(['-f', 'lavfi', '-t', str(duration), '-i', 'anullsrc=r=48000:cl=stereo'])
+    
+    cmd.extend(['-filter_complex', filter_complex, '-map', '[video]', '-map', f'{audio_input}:a'])
+    cmd.extend(encoder_args)
+    cmd.extend([
+        '-pix_fmt', 'yuv420p',
+        '-g', '30',  # Keyframe interval
+        '-c:a', 'pcm_s16le',
+        '-ar', '48000',
+        '-ac', '2',
+        '-t', str(duration),
+        segment_file
+    ])
+    return cmd
+
+def render_segments(segments, segment_files, background_video, width, height, encoder):
+    """
+    Render every timeline segment to its own file, several ffmpeg processes at a time
+    Returns (command, result) for the first segment that failed, or None
+    """
+    encoder_name, decoder_args, encoder_args = encoder
+    print(f"Rendering {len(segments)} segments with {encoder_name}...")
+    segment_cmds = [
+        build_segment_command(background_video, start, duration, image_file, audio_file,
+                              segment_file, width, height, decoder_args, encoder_args)
+        for (start, duration, image_file, audio_file), segment_file in zip(segments, segment_files)
+    ]
+    
+    # Consumer GPUs cap concurrent hardware encode sessions (3 on older NVENC drivers)
+    max_workers = min(4, os.cpu_count() or 1) if encoder_name == 'libx264' else 2
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(
+            lambda cmd: subprocess.run(cmd, capture_output=True, text=True), segment_cmds))
+    
+    for cmd, result in zip(segment_cmds, results):
+        if result.returncode != 0:
+            return cmd, result
+    return None
 
 def create_vertical_video_with_video_bg(csv_file, image_dir, audio_dir, background_video, output_video):
     """Create vertical 9:16 video with video background and proper audio"""
@@ -68,131 +170,72 @@ def create_vertical_video_with_video_bg(csv_file, image_dir, audio_dir, backgrou
     print(f"Creating vertical 9:16 video with video background...")
     print(f"Total duration will be: {total_duration:.3f} seconds")
     
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Create filter complex for entire video
-        filter_parts = []
-        audio_parts = []
-        
-        # Scale and crop background video
-        filter_parts.append(f'[0:v]scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},setsar=1[bg];')
-        
-        # Create silent audio for intro
-        filter_parts.append(f'aevalsrc=0:duration={intro_duration}:sample_rate=44100:channel_layout=stereo[intro_audio];')
-        audio_parts.append('[intro_audio]')
-        
-        # Process each comment
-        current_time = intro_duration
-        for idx in range(len(df)):
-            file_number = idx + 1
-            duration = audio_durations[idx]
-            
-            # Trim background video for this segment
-            filter_parts.append(f'[bg]trim={current_time}:{current_time + duration},setpts=PTS-STARTPTS[bg{idx}];')
-            
-            # Scale overlay image
-            filter_parts.append(f'[{idx + 1}:v]scale={width}:{height}[overlay{idx}];')
-            
-            # Overlay comment on background
-            filter_parts.append(f'[bg{idx}][overlay{idx}]overlay=0:0[v{idx}];')
-            
-            # Add audio
-            audio_parts.append(f'[{len(df) + idx + 1}:a]')
-            
-            current_time += duration
-            
-            # Add pause if not last segment
-            if idx < len(df) - 1:
-                # Create pause video segment
-                filter_parts.append(f'[bg]trim={current_time}:{current_time + pause_duration},setpts=PTS-STARTPTS[pause{idx}];')
-                # Create pause audio
-                filter_parts.append(f'aevalsrc=0:duration={pause_duration}:sample_rate=44100:channel_layout=stereo[pause_audio{idx}];')
-                audio_parts.append(f'[pause_audio{idx}]')
-                current_time += pause_duration
-        
-        # Create outro
-        filter_parts.append(f'[bg]trim={current_time}:{current_time + outro_duration},setpts=PTS-STARTPTS[outro_v];')
-        filter_parts.append(f'aevalsrc=0:duration={outro_duration}:sample_rate=44100:channel_layout=stereo[outro_audio];')
-        audio_parts.append('[outro_audio]')
-        
-        # Concatenate video segments
-        video_concat = '[intro_v]' if intro_duration > 0 else ''
-        video_parts = []
+    # Timeline segments: (start time, duration, comment image, comment audio)
+    segments = [(0.0, intro_duration, None, None)]
+    current_time = intro_duration
+    for idx in range(len(df)):
+        file_number = idx + 1
+        image_file = os.path.join(image_dir, f'comment_{file_number:02d}_transparent.png')
+        audio_file = os.path.join(audio_dir, f'audio_{file_number:02d}.wav')
+        segments.append((current_time, audio_durations[idx], image_file, audio_file))
+        current_time += audio_durations[idx]
         
-        # Add intro segment (just background)
-        filter_parts.append(f'[bg]trim=0:{intro_duration},setpts=PTS-STARTPTS[intro_v];')
-        video_parts.append('[intro_v]')
+        # Add pause if not last segment
+        if idx < len(df) - 1:
+            segments.append((current_time, pause_duration, None, None))
+            current_time += pause_duration
+    segments.append((current_time, outro_duration, None, None))
+    
+    encoder = get_video_encoder()
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        segment_files = [os.path.join(temp_dir, f'segment_{i:03d}.mkv') for i in range(len(segments))]
+        failed = render_segments(segments, segment_files, background_video, width, height, encoder)
         
-        # Add comment segments and pauses
-        for idx in range(len(df)):
-            video_parts.append(f'[v{idx}]')
-            if idx < len(df) - 1:
-                video_parts.append(f'[pause{idx}]')
+        # A hardware encoder can still fail mid-run (e.g. out of encode sessions); redo every
+        # segment on the CPU, since the video is joined without re-encoding and the segments must match
+        if failed and encoder[0] != 'libx264':
+            print(f"{encoder[0]} failed on a segment, re-rendering with libx264...")
+            failed = render_segments(segments, segment_files, background_video, width, height,
+                                     VIDEO_ENCODERS[-1])
         
-        # Add outro
-        video_parts.append('[outro_v]')
+        if failed:
+            cmd, result = failed
+            print(f"Error creating video segment: {result.stderr}")
+            # Save command for debugging
+            with open('debug_command.txt', 'w') as f:
+                f.write(' '.join(cmd))
+            print("Command saved to debug_command.txt")
+            return
         
-        # Concatenate all video segments
-        concat_count = len(video_parts)
-        filter_parts.append(f'{"".join(video_parts)}concat=n={concat_count}:v=1:a=0[video];')
+        # List segments for the concat demuxer
+        concat_list = os.path.join(temp_dir, 'segments.txt')
+        with open(concat_list, 'w') as f:
+            for segment_file in segment_files:
+                f.write(f"file '{segment_file}'\n")
         
-        # Concatenate all audio segments
-        audio_concat_count = len(audio_parts)
-        filter_parts.append(f'{"".join(audio_parts)}concat=n={audio_concat_count}:v=0:a=1[concat_audio];')
+        # Join the segments without re-encoding video; only the audio is mixed and encoded
+        cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', concat_list]
         
         # Mix with background music
         if os.path.exists(music_file):
+            cmd.extend(['-i', music_file])
             # Process voice and music
-            filter_parts.append('[concat_audio]volume=1.5,highpass=f=100,lowpass=f=3000[voice];')
-            filter_parts.append(f'[{len(df) * 2 + 1}:a]volume=0.08[music];')
-            filter_parts.append('[voice][music]amix=inputs=2:duration=first:weights=1 0.5[final_audio]')
-            audio_output = '[final_audio]'
+            filter_complex = ('[0:a]volume=1.5,highpass=f=100,lowpass=f=3000[voice];'
+                              '[1:a]volume=0.08[music];'
+                              '[voice][music]amix=inputs=2:duration=first:weights=1 0.5[final_audio]')
         else:
             # Just use voice
-            filter_parts.append('[concat_audio]volume=1.5[final_audio]')
-            audio_output = '[final_audio]'
-        
-        # Build filter complex
-        filter_complex = ''.join(filter_parts)
-        
-        # Build ffmpeg command
-        cmd = ['ffmpeg', '-y']
-        
-        # Input background video
-        cmd.extend(['-i', background_video])
-        
-        # Input comment images
-        for idx in range(len(df)):
-            image_file = os.path.join(image_dir, f'comment_{idx + 1:02d}_transparent.png')
-            cmd.extend(['-i', image_file])
-        
-        # Input audio files
-        for idx in range(len(df)):
-            audio_file = os.path.join(audio_dir, f'audio_{idx + 1:02d}.wav')
-            cmd.extend(['-i', audio_file])
-        
-        # Input background music if exists
-        if os.path.exists(music_file):
-            cmd.extend(['-i', music_file])
+            filter_complex = '[0:a]volume=1.5[final_audio]'
         
-        # Add filter complex
         cmd.extend(['-filter_complex', filter_complex])
         
         # Map outputs
-        cmd.extend(['-map', '[video]', '-map', audio_output])
+        cmd.extend(['-map', '0:v', '-map', '[final_audio]'])
         
         # Output settings
         cmd.extend([
-            '-c:v', 'libx264',
-            '-preset', 'slow',  # High quality preset
-            '-crf', '18',  # Even better quality (lower = better)
-            '-pix_fmt', 'yuv420p',
-            '-g', '30',  # Keyframe interval
-            '-bf', '3',  # More B-frames for better quality
-            '-refs', '4',  # More reference frames
-            '-qmin', '10',  # Minimum quantizer
-            '-qmax', '51',  # Maximum quantizer
-            '-profile:v', 'high',  # H.264 high profile for better quality
-            '-level', '4.1',  # Compatibility level
+            '-c:v', 'copy',
             '-c:a', 'aac',
             '-b:a', '256k',  # Higher audio bitrate too
             '-ar', '48000',  # Higher sample rate
@@ -203,7 +246,7 @@ def create_vertical_video_with_video_bg(csv_file, image_dir, audio_dir, backgrou
         
         # Execute command
         print("Running ffmpeg command...")
-        print(f"Processing {len(df)} comments with video background...")
+        print(f"Joining {len(segments)} segments for {len(df)} comments...")
         
         result = subprocess.run(cmd, capture_output=True, text=True)
         
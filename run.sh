@@ -45,7 +45,12 @@ source venv/bin/activate
 # Install requirements if needed
 if [ -f "requirements.txt" ]; then
     echo "   Installing/updating requirements..."
-    pip install -r requirements.txt
+    if pip show pillow-simd &> /dev/null; then
+        # Pillow-SIMD replaces Pillow; installing Pillow too would overwrite it
+        grep -v -i '^pillow' requirements.txt | pip install -r /dev/stdin
+    else
+        pip install -r requirements.txt
+    fi
     if [ $? -ne 0 ]; then
         echo "Error: Failed to install requirements"
         exit 1